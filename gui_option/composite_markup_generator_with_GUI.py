@@ -10,15 +10,25 @@ if os.name == 'nt': # if os is windows
 
 import sys
 import re
-import collections
 import sqlite3
+import pathlib
 import nocairosvg
+import PIL
 from PIL import Image
+from install_playwright import install
+from playwright.sync_api import sync_playwright
 import io
+import contextlib
+import multiprocessing
+import multiprocessing.util
+import concurrent.futures
+import base64
+import queue
 
 from PyQt5.QtCore import (
-    QThread, pyqtSignal, QDir, QObject
+    QThread, pyqtSignal, QDir, QTimer
 )
+from PyQt5.QtGui import QTextCursor
 from PyQt5.QtWidgets import (
     QApplication, QWidget, QLabel, QLineEdit, QPushButton,
     QFileDialog, QHBoxLayout, QVBoxLayout, QDialog,
@@ -28,17 +38,30 @@ from PyQt5.QtWidgets import (
 ###############################################################################
 # Real-time Print Capture
 ###############################################################################
-class EmittingStream(QObject):
+# The worker thread blocks on print() only if the GUI falls this many writes behind
+CONSOLE_QUEUE_SIZE = 10000
+# How often the GUI thread moves queued console text into the window, and how much per tick
+CONSOLE_DRAIN_INTERVAL_MS = 50
+CONSOLE_MAX_CHUNKS_PER_TICK = 1000
+# Oldest console lines are dropped past this point so long runs don't grow the document forever
+CONSOLE_MAX_LINES = 5000
+
+
+class EmittingStream:
     """
-    A custom stream that sends console text as a Qt signal (line by line).
+    A custom stream that hands console text to a thread-safe queue.
+    The GUI thread drains the queue on a timer instead of handling one Qt signal per print.
     """
-    textWritten = pyqtSignal(str)
+    def __init__(self, text_queue):
+        self.text_queue = text_queue
+        self.history = []
 
     def write(self, text):
         # Each print statement often ends with '\n', but might not.
-        # We'll simply emit whatever text we get.
+        # We'll simply queue whatever text we get.
         if text:
-            self.textWritten.emit(text)
+            self.history.append(text)
+            self.text_queue.put(text)
 
     def flush(self):
         """Required for Python 3, but can be a no-op."""
@@ -72,217 +95,319 @@ def check_input_dir(dir_path):
 ###############################################################################
 # DB Access Functions
 ###############################################################################
-def get_volume_id_for_bookmark(bookmark_id, db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    cursor.execute("SELECT VolumeID FROM Bookmark WHERE BookmarkID = ?", (bookmark_id,))
-    row = cursor.fetchone()
-
-    cursor.close()
-    conn.close()
+BOOKMARK_METADATA_QUERY = """
+    SELECT b.BookmarkID, b.VolumeID, b.StartContainerPath, c.Title, c.adobe_location
+    FROM Bookmark b
+    LEFT JOIN content c ON c.ContentID = b.ContentID
+    WHERE b.BookmarkID IN (%s)
+"""
+# Stay well below SQLite's bound-variable limit for the IN (...) list
+BOOKMARK_IDS_PER_QUERY = 500
 
-    if row:
-        return row[0]
-    return None
-
-
-def get_section_title_for_bookmark(bookmark_id, db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
 
-    query = """
-        SELECT Title 
-        FROM content 
-        WHERE ContentID = (
-            SELECT ContentID 
-            FROM Bookmark 
-            WHERE BookmarkID = ?
-        )
+def open_kobo_db(db_path):
+    """
+    Opens KoboReader.sqlite read-only and tunes the connection for a single bulk read.
+    """
+    # mode=ro skips write locking; immutable=1 is avoided so a pending -wal file is still honoured
+    db_uri = pathlib.Path(os.path.abspath(db_path)).as_uri() + "?mode=ro"
+    conn = sqlite3.connect(db_uri, uri=True)
+    conn.executescript(
+        "PRAGMA query_only=ON;"
+        "PRAGMA mmap_size=268435456;"
+        "PRAGMA cache_size=-65536;"
+        "PRAGMA temp_store=MEMORY;"
+    )
+    return conn
+
+
+def get_bookmark_metadata(bookmark_ids, cursor):
     """
-    cursor.execute(query, (bookmark_id,))
-    row = cursor.fetchone()
+    Fetches everything needed to name the composites for all bookmarks at once.
+    Returns {BookmarkID: (VolumeID, StartContainerPath, Title, adobe_location)}.
+    """
+    metadata = {}
+    for i in range(0, len(bookmark_ids), BOOKMARK_IDS_PER_QUERY):
+        chunk = bookmark_ids[i:i + BOOKMARK_IDS_PER_QUERY]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(BOOKMARK_METADATA_QUERY % placeholders, chunk)
+        for row in cursor.fetchall():
+            metadata[row[0]] = row[1:]
+    return metadata
 
-    cursor.close()
-    conn.close()
 
-    if row:
-        return row[0]
-    return None
+def get_book_title(volume_id):
+    if volume_id is None:
+        return "UnknownBook"
+    vol_split = volume_id.split("/")
+    return vol_split[-1] if vol_split else "UnknownBook"
 
 
-def get_book_part_number_for_bookmark(bookmark_id, db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
+def get_book_part_number(adobe_location):
+    unclean_part_name = str(adobe_location).split("/")
+    part_name_with_html = unclean_part_name[-1].split(".")
+    return part_name_with_html[0]
 
-    query = """
-        SELECT adobe_location
-        FROM content 
-        WHERE ContentID = (
-            SELECT ContentID 
-            FROM Bookmark 
-            WHERE BookmarkID = ?
-        )
-    """
-    cursor.execute(query, (bookmark_id,))
-    row = cursor.fetchone()
 
-    cursor.close()
-    conn.close()
+# Point location inside an ePub CFI, e.g. "point(/1/4/2/6:15)", and the characters swapped for dots
+POINT_LOCATION_PATTERN = re.compile(r'point\((/[\d/]+:\d+)\)')
+POINT_LOCATION_TO_DOTS = str.maketrans(":/", "..")
 
-    if row:
-        unclean_part_name = str(row[0]).split("/")
-        part_name_with_html = unclean_part_name[-1].split(".")
-        return part_name_with_html[0]
-    return None
 
-
-def get_ordering_number_for_bookmark(bookmark_id, db_path):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-
-    query = """
-        SELECT StartContainerPath 
-        FROM Bookmark 
-        WHERE BookmarkID = ?
-    """
-    cursor.execute(query, (bookmark_id,))
-    row = cursor.fetchone()
-    
-    if row:
-        pattern = re.compile(r'point\((/[\d/]+:\d+)\)')
-        match = pattern.search(row[0])
+def get_ordering_number(start_container_path):
+    if start_container_path:
+        match = POINT_LOCATION_PATTERN.search(start_container_path)
         if match:
             extracted_point_location = match.group(1)
-            cleaned_point_location = extracted_point_location.replace(":", ".").replace("/", ".")
-            cursor.close()
-            conn.close()
+            cleaned_point_location = extracted_point_location.translate(POINT_LOCATION_TO_DOTS)
             return cleaned_point_location
 
-    cursor.close()
-    conn.close()
     return None
 
 
 ###############################################################################
 # SVG + JPG -> PNG Composite
 ###############################################################################
+# Draws an SVG into the page's canvas and returns the pixels as a PNG data URL.
+# Resizing the canvas also clears it, so the same canvas is reused for every pair.
+RENDER_SVG_SCRIPT = """
+async ([url, width, height]) => {
+    const img = new Image();
+    img.crossOrigin = '*';
+    await new Promise((resolve, reject) => {
+        img.onload = resolve;
+        img.onerror = () => reject(new Error('Could not load ' + url));
+        img.src = url;
+    });
+    const canvas = document.getElementById('canvas1');
+    canvas.width = width;
+    canvas.height = height;
+    canvas.getContext('2d').drawImage(img, 0, 0, width, height);
+    return canvas.toDataURL('image/png');
+}
+"""
+
+# Headless browser page that rasterizes the SVGs, set up once per process and reused for every pair
+_svg_page = None
+_svg_browser = None
+_svg_playwright = None
+# Closes that browser when the worker process exits. Pool workers end without running
+# atexit hooks, but multiprocessing runs its finalizers that have an exitpriority.
+_svg_finalizer = None
+
+
+def get_svg_page():
+    """
+    Returns this process's canvas page, launching headless Chromium and loading
+    nocairosvg's convert.html on first use. nocairosvg.convert() would start
+    (and install-check) a new browser and reload the page for every SVG.
+    """
+    global _svg_page, _svg_browser, _svg_playwright, _svg_finalizer
+    if _svg_page is None:
+        _svg_finalizer = multiprocessing.util.Finalize(None, close_svg_page, exitpriority=10)
+        _svg_playwright = sync_playwright().start()
+        install([_svg_playwright.chromium])
+        _svg_browser = _svg_playwright.chromium.launch(
+            args=["--no-sandbox", "--disable-web-security", "--allow-file-access-from-files"]
+        )
+        page = _svg_browser.new_page()
+        page.set_viewport_size({"width": 4000, "height": 4000})
+        page.goto(pathlib.Path(nocairosvg.THISDIR, "convert.html").as_uri())
+        _svg_page = page
+    return _svg_page
+
+
+def close_svg_page():
+    """
+    Shuts down this process's Chromium and Playwright, if running, so the next
+    get_svg_page() starts a fresh browser. Safe to call on a browser that already died.
+    """
+    global _svg_page, _svg_browser, _svg_playwright, _svg_finalizer
+    if _svg_finalizer is not None:
+        _svg_finalizer.cancel()
+    browser, playwright = _svg_browser, _svg_playwright
+    _svg_page = _svg_browser = _svg_playwright = _svg_finalizer = None
+
+    if browser is not None:
+        with contextlib.suppress(Exception):
+            browser.close()
+    if playwright is not None:
+        with contextlib.suppress(Exception):
+            playwright.stop()
+
+
+def render_svg_overlay(svg_path, width, height):
+    """
+    Rasterizes an SVG at width x height and returns it as an RGBA PIL image.
+    Draws into the shared canvas page and decodes the canvas PNG straight into PIL
+    without re-encoding it.
+    """
+    svg_url = pathlib.Path(os.path.abspath(svg_path)).as_uri()
+    try:
+        png_data_url = get_svg_page().evaluate(RENDER_SVG_SCRIPT, [svg_url, width, height])
+    except Exception:
+        # A crashed browser would fail every later pair on this worker ("Target closed"),
+        # so drop it and let the next pair launch a new one
+        close_svg_page()
+        raise
+
+    png_bytes = base64.b64decode(png_data_url.split(",", 1)[1])
+    overlay_image = Image.open(io.BytesIO(png_bytes))
+    if overlay_image.mode != "RGBA":
+        overlay_image = overlay_image.convert("RGBA")
+    return overlay_image
+
+
 def overlay_svg_on_jpg(
     jpg_path, 
     svg_path, 
     output_path,
     final_width=1264, 
-    final_height=1680
+    final_height=1680,
+    png_compress_level=1
 ):
-    temp_overlay = "temp_overlay.png"
-
     print(f"Overlaying:\n  JPG: {jpg_path}\n  SVG: {svg_path}\n-> {output_path}")
 
     try:
-        # Convert SVG -> PNG
-        nocairosvg.svg2png(
-            url=svg_path,
-            write_to=temp_overlay,
-            output_width=final_width,
-            output_height=final_height
-        )
-
-        # Resize the JPG
-        bg_image = Image.open(jpg_path).convert("RGBA")
-        bg_image = bg_image.resize(
-            (final_width, final_height),
-            Image.Resampling.LANCZOS
-        )
-
-        # Open the rendered PNG
-        overlay_image = Image.open(temp_overlay).convert("RGBA")
+        # Rasterize the SVG straight to an RGBA image
+        overlay_image = render_svg_overlay(svg_path, final_width, final_height)
+
+        # Resize the JPG (Kobo page images are usually already at the final size)
+        # The page is opaque, so it stays RGB; only the overlay needs an alpha channel.
+        # draft() lets libjpeg scale oversized pages down by 1/2, 1/4 or 1/8 while decoding,
+        # so the full-resolution page is never materialised just to be resized away.
+        bg_image = Image.open(jpg_path)
+        bg_image.draft("RGB", (final_width, final_height))
+        bg_image = bg_image.convert("RGB")
+        if bg_image.size != (final_width, final_height):
+            # For large downscales, shrink cheaply to 1.25x the target before the Lanczos pass
+            if bg_image.width > 2 * final_width or bg_image.height > 2 * final_height:
+                bg_image = bg_image.resize(
+                    (round(final_width * 1.25), round(final_height * 1.25)),
+                    Image.Resampling.BILINEAR
+                )
+            bg_image = bg_image.resize(
+                (final_width, final_height),
+                Image.Resampling.LANCZOS
+            )
 
-        # Composite
-        composite_image = Image.alpha_composite(bg_image, overlay_image)
+        # Composite: pasting with the overlay's own alpha as the mask blends it over the page
+        bg_image.paste(overlay_image, (0, 0), overlay_image)
 
-        # Save
-        composite_image.save(output_path, format="PNG")
+        # Save (zlib level 1 encodes several times faster than the default 6 for a slightly larger file)
+        bg_image.save(output_path, format="PNG", compress_level=png_compress_level, optimize=False)
         print(f"Saved composite image: {output_path}\n")
 
     except Exception as e:
         print(f"Could not process {svg_path} with {jpg_path}: {e}\n")
 
-    finally:
-        if os.path.exists(temp_overlay):
-            os.remove(temp_overlay)
+
+def overlay_pair_worker(jpg_path, svg_path, output_path):
+    """
+    Process-pool entry point for one pair. Returns everything overlay_svg_on_jpg printed
+    (or warned on stderr) so the parent process can echo it into the GUI console.
+    Forked workers inherit the parent's console stream, whose queue nothing drains here.
+    """
+    captured = io.StringIO()
+    with contextlib.redirect_stdout(captured), contextlib.redirect_stderr(captured):
+        overlay_svg_on_jpg(jpg_path, svg_path, output_path)
+    return captured.getvalue()
 
 
 ###############################################################################
 # Main Script Logic
 ###############################################################################
+def is_composite_up_to_date(output_path, jpg_path, svg_path):
+    """True if output_path exists and is at least as new as both of its source files."""
+    if not os.path.exists(output_path):
+        return False
+    source_mtime = max(os.path.getmtime(jpg_path), os.path.getmtime(svg_path))
+    return os.path.getmtime(output_path) >= source_mtime
+
+
 def main(db_path, input_dir, output_dir, progress_callback=None):
     """
     1) Creates a subfolder "composite markups" in the user-chosen output_dir.
     2) Finds all .jpg + .svg pairs in the user-chosen input_dir that share the same base name.
     3) Overlays the SVG on top of the JPG at 1264 x 1680.
-    4) Saves the resulting PNG in output_dir/composite markups/<book_title>.
+    4) Saves the resulting PNG in output_dir/composite markups/<book_title>,
+       skipping pairs whose PNG is already newer than both source files.
     5) Calls progress_callback(i, total) after each processed pair, if provided.
     """
 
     print("Starting main script logic...")
     print(f"DB Path: {db_path}")
     print(f"Input Dir: {input_dir}")
-    print(f"Output Dir: {output_dir}\n")
+    print(f"Output Dir: {output_dir}")
+    # Pillow-SIMD releases carry a ".postN" version suffix
+    pillow_flavour = "Pillow-SIMD" if "post" in PIL.__version__ else "Pillow"
+    print(f"Imaging library: {pillow_flavour} {PIL.__version__}\n")
 
     base_output_dir = os.path.join(output_dir, "composite markups")
     os.makedirs(base_output_dir, exist_ok=True)
     print(f"Created/verified base output dir: {base_output_dir}\n")
 
-    all_files = os.listdir(input_dir)
-    file_map = collections.defaultdict(list)
-
-    # Identify .jpg and .svg pairs
-    for filename in all_files:
-        base, ext = os.path.splitext(filename)
-        ext = ext.lower()
-        if ext in (".jpg", ".svg"):
-            file_map[base].append(ext)
-            # If ext is SVG, attempt to get book title
-            if ext == ".svg":
-                unclean_vol_id = get_volume_id_for_bookmark(base, db_path)
-                if unclean_vol_id is None:
-                    book_title = "UnknownBook"
-                else:
-                    vol_split = unclean_vol_id.split("/")
-                    book_title = vol_split[-1] if vol_split else "UnknownBook"
-                file_map[base].append(book_title)
-
-    # Count how many pairs exist (for progress updates)
-    pairs_to_process = [
-        base for base, exts in file_map.items()
-        if ".jpg" in exts and ".svg" in exts
-    ]
+    # Base names seen with each extension; a pair is a base name present in both
+    jpg_bases = set()
+    svg_bases = set()
+
+    # 1) Scan the input folder for .jpg and .svg files (DirEntry caches the file type,
+    #    so skipping folders needs no extra stat). No DB access happens here.
+    with os.scandir(input_dir) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            base, ext = os.path.splitext(entry.name)
+            ext = ext.lower()
+            if ext == ".jpg":
+                jpg_bases.add(base)
+            elif ext == ".svg":
+                svg_bases.add(base)
+
+    # 2) Keep only base names that have BOTH .jpg AND .svg
+    pairs_to_process = sorted(jpg_bases & svg_bases)
     total_pairs = len(pairs_to_process)
 
     if total_pairs == 0:
         print("No matching .jpg + .svg pairs found.\n")
         return
 
+    # 3) Resolve the metadata of the paired bookmarks only, in one batched query
+    #    on a single read-only connection (orphan SVGs are never looked up)
+    conn = open_kobo_db(db_path)
+    cursor = conn.cursor()
+    try:
+        metadata = get_bookmark_metadata(pairs_to_process, cursor)
+    finally:
+        cursor.close()
+        conn.close()
+
+    # BookmarkID -> book folder name
+    titles = {
+        bookmark_id: get_book_title(volume_id)
+        for bookmark_id, (volume_id, *_) in metadata.items()
+    }
+
     print(f"Found {total_pairs} matching pairs. Beginning overlay...\n")
 
-    processed_count = 0
+    # 4) Resolve every output path first, then render the independent pairs in parallel.
+    #    Composites left by an earlier run are skipped unless their JPG or SVG changed since.
+    overlay_jobs = []
+    skipped_count = 0
     for base_name in pairs_to_process:
-        processed_count += 1
-
-        # Possibly multiple appended book_title strings in exts
-        exts = file_map[base_name]
-        possible_titles = [x for x in exts if x not in (".jpg", ".svg")]
-        book_title = possible_titles[-1] if possible_titles else "UnknownBook"
+        _, start_container_path, bookmark_section_name, adobe_location = metadata.get(
+            base_name, (None, None, None, None)
+        )
+        book_title = titles.get(base_name, "UnknownBook")
 
         jpg_path = os.path.join(input_dir, base_name + ".jpg")
         svg_path = os.path.join(input_dir, base_name + ".svg")
 
-        bookmark_section_name = get_section_title_for_bookmark(base_name, db_path)
         if not bookmark_section_name or len(str(bookmark_section_name)) <= 1:
             bookmark_section_name = f"Chapter {bookmark_section_name}"
 
-        book_part_name = get_book_part_number_for_bookmark(base_name, db_path)
-        markup_exact_location = get_ordering_number_for_bookmark(base_name, db_path)
+        book_part_name = get_book_part_number(adobe_location)
+        markup_exact_location = get_ordering_number(start_container_path)
 
         # Construct a final filename
         output_name = (
@@ -296,14 +421,29 @@ def main(db_path, input_dir, output_dir, progress_callback=None):
         os.makedirs(book_dir, exist_ok=True)
 
         output_path = os.path.join(book_dir, output_name)
-        overlay_svg_on_jpg(jpg_path, svg_path, output_path)
-
-        # Update progress bar in real time
+        if is_composite_up_to_date(output_path, jpg_path, svg_path):
+            skipped_count += 1
+            continue
+        overlay_jobs.append((jpg_path, svg_path, output_path))
+
+    processed_count = skipped_count
+    if skipped_count:
+        print(f"Skipping {skipped_count} pairs whose composite is already up to date.\n")
         if progress_callback:
             progress_callback(processed_count, total_pairs)
 
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        futures = [executor.submit(overlay_pair_worker, *job) for job in overlay_jobs]
+        for future in concurrent.futures.as_completed(futures):
+            processed_count += 1
+            print(future.result(), end="")
+
+            # Update progress bar in real time
+            if progress_callback:
+                progress_callback(processed_count, total_pairs)
+
     print("\nAll matching .jpg + .svg pairs have been processed.")
-    print(f"Processed {processed_count} pairs.\n")
+    print(f"Processed {processed_count} pairs ({skipped_count} already up to date).\n")
 
 
 ###############################################################################
@@ -312,9 +452,8 @@ def main(db_path, input_dir, output_dir, progress_callback=None):
 class CompositeScriptThread(QThread):
     """
     Runs the `main(db_path, input_dir, output_dir, ...)` in a background thread,
-    capturing prints line-by-line so we can update the GUI console in real time.
+    queueing prints on text_queue so the GUI console can drain them in real time.
     """
-    line_signal = pyqtSignal(str)         # Emitted each time a line is printed
     progress_signal = pyqtSignal(int, int)  # (current, total)
     finished_signal = pyqtSignal(str)     # final text (buffer) once done
 
@@ -324,13 +463,12 @@ class CompositeScriptThread(QThread):
         self.input_dir = input_dir
         self.output_dir = output_dir
 
-        # We'll store all console text in a buffer so we can emit it at the end as well.
-        self._buffer = []
+        # Console text waiting for the GUI thread to pick it up
+        self.text_queue = queue.Queue(maxsize=CONSOLE_QUEUE_SIZE)
 
     def run(self):
-        # Create EmittingStream to capture all prints line-by-line
-        emitting_stream = EmittingStream()
-        emitting_stream.textWritten.connect(self.on_new_stdout_line)
+        # Create EmittingStream to capture all prints
+        emitting_stream = EmittingStream(self.text_queue)
 
         # Save old stdout/stderr
         old_stdout = sys.stdout
@@ -356,19 +494,10 @@ class CompositeScriptThread(QThread):
             # Restore old stdout/stderr
             sys.stdout = old_stdout
             sys.stderr = old_stderr
-            # Emit everything collected in _buffer as final output
-            final_output = "".join(self._buffer)
+            # Emit everything the stream collected as final output
+            final_output = "".join(emitting_stream.history)
             self.finished_signal.emit(final_output)
 
-    def on_new_stdout_line(self, text):
-        """
-        Called each time the script prints a line.
-        We'll both store it and emit a line_signal
-        so the GUI can update in real time.
-        """
-        self._buffer.append(text)
-        self.line_signal.emit(text)
-
 
 ###############################################################################
 # Progress/Console Window
@@ -390,12 +519,19 @@ class ProgressWindow(QDialog):
 
         self.console_text = QTextEdit()
         self.console_text.setReadOnly(True)
+        self.console_text.document().setMaximumBlockCount(CONSOLE_MAX_LINES)
 
         layout = QVBoxLayout()
         layout.addWidget(self.progress_bar)
         layout.addWidget(self.console_text)
         self.setLayout(layout)
 
+        # Periodically moves text from the worker's queue into the console
+        self.text_queue = None
+        self.drain_timer = QTimer(self)
+        self.drain_timer.setInterval(CONSOLE_DRAIN_INTERVAL_MS)
+        self.drain_timer.timeout.connect(self.drain_text_queue)
+
     def set_progress_range(self, total):
         self.progress_bar.setRange(0, total)
 
@@ -403,9 +539,31 @@ class ProgressWindow(QDialog):
         self.progress_bar.setValue(current)
 
     def append_text(self, text):
+        """Insert a whole batch of text at the end, then do a single scroll/layout pass."""
+        self.console_text.moveCursor(QTextCursor.End)
         self.console_text.insertPlainText(text)
         self.console_text.ensureCursorVisible()
 
+    def watch_text_queue(self, text_queue):
+        self.text_queue = text_queue
+        self.drain_timer.start()
+
+    def drain_text_queue(self, max_chunks=CONSOLE_MAX_CHUNKS_PER_TICK):
+        """Append everything queued since the last tick (up to max_chunks) in one go."""
+        chunks = []
+        try:
+            while len(chunks) < max_chunks:
+                chunks.append(self.text_queue.get_nowait())
+        except queue.Empty:
+            pass
+        if chunks:
+            self.append_text("".join(chunks))
+
+    def stop_watching_text_queue(self):
+        """Stop the timer and flush whatever the worker queued before it finished."""
+        self.drain_timer.stop()
+        self.drain_text_queue(max_chunks=self.text_queue.qsize() + 1)
+
 
 ###############################################################################
 # Main GUI
@@ -523,8 +681,8 @@ class SimpleGui(QWidget):
         self.thread = CompositeScriptThread(db_file, input_dir, output_dir)
 
         # Connect signals:
-        # 1) line_signal => append text as soon as it's printed
-        self.thread.line_signal.connect(self.progress_window.append_text)
+        # 1) printed text => drained from the thread's queue by the progress window
+        self.progress_window.watch_text_queue(self.thread.text_queue)
 
         # 2) progress_signal => update progress bar
         self.thread.progress_signal.connect(self.on_progress_update)
@@ -546,8 +704,9 @@ class SimpleGui(QWidget):
     def on_script_finished(self, final_output):
         """
         Called when the script finishes. 
-        We'll append the final buffer, then print "Done!"
+        We'll flush any queued text, then print "Done!"
         """
+        self.progress_window.stop_watching_text_queue()
         self.progress_window.append_text("""\nDone!\n\nClose out of this pop-up to return to the main dialog window. If you're completely done with this tool, please close the main dialog window as well.\n\nThank you for using the Composite Markup Generator Tool!\n\nTool Creator: Lauryn Eldridge (@leldr on github)\n
                                          """)
 
@@ -556,6 +715,8 @@ class SimpleGui(QWidget):
 # Entry Point
 ###############################################################################
 if __name__ == "__main__":
+    # Needed for the overlay process pool in frozen (PyInstaller) builds
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     window = SimpleGui()
     window.show()
@@ -13,200 +13,338 @@ if os.name == 'nt': # if os is windows
     os.environ['PATH'] = path #update the  PATH env var with the correct value stored in the path variable we just declared.
 #print(os.environ['PATH'])
 
-import collections
+import base64
+import concurrent.futures
+import contextlib
+import dataclasses
+import itertools
+import io
+import multiprocessing.util
+import pathlib
 import nocairosvg
+from install_playwright import install
+from playwright.sync_api import sync_playwright
 from PIL import Image
 import sqlite3
 import re
 
-def get_volume_id_for_bookmark(bookmark_id):
-    """
-    Retrieves the VolumeID for a given BookmarkID from the Bookmark table.
-    
-    :param bookmark_id: The BookmarkID (string) to look up in the database.
-    :return: The VolumeID (string) if found, otherwise None.
-    """
-    conn = sqlite3.connect("../KoboReader.sqlite")
-    cursor = conn.cursor()
+KOBO_DB_PATH = "../KoboReader.sqlite"
 
-    cursor.execute("SELECT VolumeID FROM Bookmark WHERE BookmarkID = ?", (bookmark_id,))
-    row = cursor.fetchone()
-    
-    cursor.close()
-    conn.close()
-    
-    if row:
-        return row[0]
-    return None
+BOOKMARK_METADATA_QUERY = """
+    SELECT b.BookmarkID, b.VolumeID, b.StartContainerPath, c.Title, c.adobe_location
+    FROM Bookmark b
+    LEFT JOIN content c ON c.ContentID = b.ContentID
+    WHERE b.BookmarkID IN (%s)
+"""
+# Stay well below SQLite's bound-variable limit for the IN (...) list
+BOOKMARK_IDS_PER_QUERY = 500
 
-import sqlite3
+# Extracts the point location from a StartContainerPath, e.g. "point(/1/4/2:5)"
+POINT_LOCATION_PATTERN = re.compile(r'point\((/[\d/]+:\d+)\)')
+# Turns both ':' and '/' into '.' in one pass
+POINT_LOCATION_TO_DOTS = str.maketrans(":/", "..")
 
-def get_section_title_for_bookmark(bookmark_id):
+def get_bookmark_metadata(bookmark_ids):
     """
-    Retrieves the Title for a given BookmarkID from the Bookmark and Content tables.
+    Retrieves, in one batched JOIN over the Bookmark and Content tables, everything needed
+    to name the composite image of each BookmarkID.
     
-    :param bookmark_id: The BookmarkID (string) to look up in the database.
-    :return: The Title (string) if found, otherwise None.
+    :param bookmark_ids: The BookmarkIDs (strings) to look up in the database.
+    :return: A dict mapping each BookmarkID found to a
+             (VolumeID, StartContainerPath, Title, adobe_location) tuple.
     """
-    conn = sqlite3.connect("../KoboReader.sqlite")
+    # One read-only connection for the whole run instead of one per lookup.
+    # mode=ro skips write locking; immutable=1 is avoided so a pending -wal file is still honoured.
+    db_uri = pathlib.Path(os.path.abspath(KOBO_DB_PATH)).as_uri() + "?mode=ro"
+    conn = sqlite3.connect(db_uri, uri=True)
+    # A 64 MB page cache keeps the Bookmark and content B-trees resident across the batches
+    conn.executescript(
+        "PRAGMA query_only=ON;"
+        "PRAGMA cache_size=-65536;"
+        "PRAGMA temp_store=MEMORY;"
+    )
     cursor = conn.cursor()
 
-    query = """
-        SELECT Title 
-        FROM content 
-        WHERE ContentID = (
-            SELECT ContentID 
-            FROM Bookmark 
-            WHERE BookmarkID = ?
-        )
-    """
-    cursor.execute(query, (bookmark_id,))
-    row = cursor.fetchone()
-    
-    cursor.close()
-    conn.close()
-    
-    if row:
-        return row[0]
-    return None
+    metadata = {}
+    try:
+        for i in range(0, len(bookmark_ids), BOOKMARK_IDS_PER_QUERY):
+            chunk = bookmark_ids[i:i + BOOKMARK_IDS_PER_QUERY]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(BOOKMARK_METADATA_QUERY % placeholders, chunk)
+            metadata.update((row[0], row[1:]) for row in cursor.fetchall())
+    finally:
+        cursor.close()
+        conn.close()
 
-def get_book_part_number_for_bookmark(bookmark_id):
+    return metadata
+
+def get_book_title(volume_id):
     """
-    Retrieves the Title for a given BookmarkID from the Bookmark and Content tables.
+    Turns a bookmark's VolumeID into the book folder name.
     
-    :param bookmark_id: The BookmarkID (string) to look up in the database.
-    :return: The Title (string) if found, otherwise None.
+    :param volume_id: The VolumeID (string) of the bookmark, or None.
+    :return: The last path component of the VolumeID, or "UnknownBook".
     """
-    conn = sqlite3.connect("../KoboReader.sqlite")
-    cursor = conn.cursor()
+    if volume_id is None:
+        return "UnknownBook"
+    vol_split = volume_id.split("/")
+    return vol_split[-1] if vol_split else "UnknownBook"
 
-    query = """
-        SELECT adobe_location
-        FROM content 
-        WHERE ContentID = (
-            SELECT ContentID 
-            FROM Bookmark 
-            WHERE BookmarkID = ?
-        )
+def get_book_part_number(adobe_location):
     """
-    cursor.execute(query, (bookmark_id,))
-    row = cursor.fetchone()
-
-    cursor.close()
-    conn.close()
-
-    if row: # Check if row is not None
-        unclean_part_name = str(row[0]).split("/")
-        part_name_with_html = unclean_part_name[-1].split(".")
-        return part_name_with_html[0]
-    return None
+    Cleans a content row's adobe_location down to the book part name.
     
+    :param adobe_location: The adobe_location (string) of the bookmark's content, or None.
+    :return: The file name of the book part without its extension.
+    """
+    unclean_part_name = str(adobe_location).split("/")
+    part_name_with_html = unclean_part_name[-1].split(".")
+    return part_name_with_html[0]
 
-def get_ordering_number_for_bookmark(bookmark_id):
+def get_ordering_number(start_container_path):
     """
-    Retrieves the ePub CFI (Canonical Fragment ID) for a given BookmarkID from the Bookmark table
+    Extracts the point location from a bookmark's ePub CFI (Canonical Fragment ID)
     and cleans it for file-naming purposes.
     
-    :param bookmark_id: The BookmarkID (string) to look up in the database.
+    :param start_container_path: The StartContainerPath (string) of the bookmark, or None.
     :return: The ordering number as a string if found, otherwise None.
     """
-    # Connect to the KoboReader SQLite database
-    conn = sqlite3.connect("../KoboReader.sqlite")
-    cursor = conn.cursor()
-
-    # SQL query to retrieve the StartContainerPath for the given BookmarkID
-    query = """
-        SELECT StartContainerPath 
-        FROM Bookmark 
-        WHERE BookmarkID = ?
-    """
-    # Execute the query with the provided bookmark_id
-    cursor.execute(query, (bookmark_id,))
-    # Fetch the first row from the result set
-    row = cursor.fetchone()
-    
-    # If a row is found, proceed to extract the point location
-    if row:
-        # Define a regex pattern to extract the point location from the StartContainerPath
-        pattern = re.compile(r'point\((/[\d/]+:\d+)\)')
-        # Search for the pattern in the retrieved StartContainerPath
-        match = pattern.search(row[0])
+    if start_container_path:
+        # Search for the point location pattern in the retrieved StartContainerPath
+        match = POINT_LOCATION_PATTERN.search(start_container_path)
         
         # If a match is found, process the extracted point location
         if match:
             # Extract the matched group (the point location)
             extracted_point_location = match.group(1)
             # Replace ':' with '.' and '/' with '.' to clean the point location
-            cleaned_point_location = extracted_point_location.replace(":", ".").replace("/", ".")
-            
-            # Close the cursor and the database connection
-            cursor.close()
-            conn.close()
-            
-            # Return the cleaned point location
-            return cleaned_point_location
-    
-    # If no row is found or no match is found, close the cursor and connection
-    cursor.close()
-    conn.close()
+            return extracted_point_location.translate(POINT_LOCATION_TO_DOTS)
     
-    # Return None if the BookmarkID is not found or the point location is not extracted
+    # Return None if the point location is not extracted
     return None
 
+# Draws an SVG into nocairosvg's canvas and returns the pixels as a PNG data URL.
+# Resizing the canvas also clears it, so the same canvas is reused for every pair.
+RENDER_SVG_SCRIPT = """
+async ([url, width, height]) => {
+    const img = new Image();
+    img.crossOrigin = '*';
+    await new Promise((resolve, reject) => {
+        img.onload = resolve;
+        img.onerror = () => reject(new Error('Could not load ' + url));
+        img.src = url;
+    });
+    const canvas = document.getElementById('canvas1');
+    canvas.width = width;
+    canvas.height = height;
+    canvas.getContext('2d').drawImage(img, 0, 0, width, height);
+    return canvas.toDataURL('image/png');
+}
+"""
+
+# Headless browser page that rasterizes the SVGs, set up once per worker process
+_svg_page = None
+_svg_browser = None
+_svg_playwright = None
+# Closes that browser when the worker process exits. Pool workers end without running
+# atexit hooks, but multiprocessing runs its finalizers that have an exitpriority.
+_svg_finalizer = None
+
+def get_svg_page():
+    """
+    Launches headless Chromium and loads nocairosvg's convert.html on first use.
+    
+    :return: This process's canvas page, reused for every SVG it renders.
+    """
+    global _svg_page, _svg_browser, _svg_playwright, _svg_finalizer
+    if _svg_page is None:
+        _svg_finalizer = multiprocessing.util.Finalize(None, close_svg_page, exitpriority=10)
+        _svg_playwright = sync_playwright().start()
+        install([_svg_playwright.chromium])
+        _svg_browser = _svg_playwright.chromium.launch(
+            args=["--no-sandbox", "--disable-web-security", "--allow-file-access-from-files"]
+        )
+        page = _svg_browser.new_page()
+        page.set_viewport_size({"width": 4000, "height": 4000})
+        page.goto(pathlib.Path(nocairosvg.THISDIR, "convert.html").as_uri())
+        _svg_page = page
+    return _svg_page
+
+def close_svg_page():
+    """
+    Shuts down this process's Chromium and Playwright, if running, so the next
+    get_svg_page() call starts a fresh browser. Safe to call on a browser that already died.
+    """
+    global _svg_page, _svg_browser, _svg_playwright, _svg_finalizer
+    if _svg_finalizer is not None:
+        _svg_finalizer.cancel()
+    browser, playwright = _svg_browser, _svg_playwright
+    _svg_page = _svg_browser = _svg_playwright = _svg_finalizer = None
+
+    if browser is not None:
+        with contextlib.suppress(Exception):
+            browser.close()
+    if playwright is not None:
+        with contextlib.suppress(Exception):
+            playwright.stop()
+
+def render_svg_overlay(svg_path, width, height):
+    """
+    Rasterizes an SVG straight to a PIL image. svg2png would decode the canvas into
+    a PIL image, re-encode it as PNG bytes and leave us to decode those once more.
+    
+    :param svg_path: Path to the .svg file.
+    :param width: Width of the raster, in pixels.
+    :param height: Height of the raster, in pixels.
+    :return: The SVG as an RGBA PIL image of width x height.
+    """
+    svg_url = pathlib.Path(os.path.abspath(svg_path)).as_uri()
+    try:
+        png_data_url = get_svg_page().evaluate(RENDER_SVG_SCRIPT, [svg_url, width, height])
+    except Exception:
+        # A crashed browser would fail every later pair on this worker ("Target closed"),
+        # so drop it and let the next pair launch a new one
+        close_svg_page()
+        raise
+
+    png_bytes = base64.b64decode(png_data_url.split(",", 1)[1])
+    overlay_image = Image.open(io.BytesIO(png_bytes))
+    if overlay_image.mode != "RGBA":
+        overlay_image = overlay_image.convert("RGBA")
+    return overlay_image
+
 
 
 
+# Side of the square tiles the markup is blended in; fully transparent tiles are skipped
+COMPOSITE_TILE_SIZE = 64
+
 def overlay_svg_on_jpg(
     jpg_path, 
     svg_path, 
     output_path,
     final_width=1264, 
-    final_height=1680
+    final_height=1680,
+    png_compress_level=1
 ):
     """
     Overlays an SVG on a JPG at a fixed size of 1264 x 1680.
 
     Steps:
-        1) Convert SVG to PNG at 1264 x 1680 (temp file).
+        1) Rasterize SVG at 1264 x 1680 (straight to a PIL image).
         2) Resize background JPG to 1264 x 1680 (if needed).
-        3) Alpha-composite them (overlay on top).
-        4) Save result as a PNG.
+        3) Alpha-composite them (overlay on top), tile by tile, skipping transparent tiles.
+        4) Save result as an RGB PNG.
     """
-    temp_overlay = "temp_overlay.png"
-
     try:
-        # 1. Convert SVG -> PNG
-        nocairosvg.svg2png(
-            url=svg_path,
-            write_to=temp_overlay,
-            output_width=final_width,
-            output_height=final_height
-        )
+        # 1. Rasterize SVG -> RGBA image, straight onto the 1264 x 1680 page grid so the
+        #    overlay lines up with the JPG. The canvas pixels are decoded once, with no
+        #    svg2png re-encode or temp file in between.
+        overlay_image = render_svg_overlay(svg_path, final_width, final_height)
+
+        # 2. Open the JPG, resize to match (Kobo pages are usually already 1264 x 1680).
+        #    The page is opaque, so it stays RGB: no RGBA copy of it is ever made.
+        #    draft() lets libjpeg scale oversized pages down by 1/2, 1/4 or 1/8 while decoding,
+        #    so the full-resolution page is never materialised just to be resized away.
+        bg_image = Image.open(jpg_path)
+        bg_image.draft("RGB", (final_width, final_height))
+        if bg_image.mode != "RGB":
+            bg_image = bg_image.convert("RGB")
+        if bg_image.size != (final_width, final_height):
+            # Within ~10% of the final size on both axes, bicubic looks the same as Lanczos
+            # for a markup preview
+            near_final_size = max(
+                abs(bg_image.width / final_width - 1),
+                abs(bg_image.height / final_height - 1)
+            ) <= 0.1
+            bg_image = bg_image.resize(
+                (final_width, final_height),
+                Image.Resampling.BICUBIC if near_final_size else Image.Resampling.LANCZOS
+            )
+
+        # 3. Composite in place, and only where the markup actually is.
+        #    The overlay's alpha bbox is computed in C, so no SVG path parsing is needed.
+        #    Strokes rarely fill their bbox, so it is walked in tiles: a tile whose alpha
+        #    has no bbox is fully transparent and skipped, the rest are trimmed to their
+        #    own bbox. Pasting with the overlay's own alpha as the mask blends it over the
+        #    opaque page directly in bg_image, so no separate result image is allocated.
+        overlay_alpha = overlay_image.getchannel("A")
+        markup_bbox = overlay_alpha.getbbox()
+        if markup_bbox:
+            left, top, right, bottom = markup_bbox
+            for tile_top in range(top, bottom, COMPOSITE_TILE_SIZE):
+                for tile_left in range(left, right, COMPOSITE_TILE_SIZE):
+                    tile_bbox = overlay_alpha.crop((
+                        tile_left,
+                        tile_top,
+                        min(tile_left + COMPOSITE_TILE_SIZE, right),
+                        min(tile_top + COMPOSITE_TILE_SIZE, bottom)
+                    )).getbbox()
+                    if tile_bbox is None:
+                        continue  # nothing drawn in this tile
+
+                    box = (
+                        tile_left + tile_bbox[0],
+                        tile_top + tile_bbox[1],
+                        tile_left + tile_bbox[2],
+                        tile_top + tile_bbox[3]
+                    )
+                    markup = overlay_image.crop(box)
+                    bg_image.paste(markup, box[:2], markup)
+        composite_image = bg_image
+
+        # 4. Save (zlib level 1 encodes several times faster than the default 6 for a slightly larger file)
+        composite_image.save(output_path, format="PNG", compress_level=png_compress_level, optimize=False)
+        print(f"Saved composite image at: {output_path}")
 
-        # 2. Open the JPG, resize to match
-        bg_image = Image.open(jpg_path).convert("RGBA")
-        bg_image = bg_image.resize(
-            (final_width, final_height),
-            Image.Resampling.LANCZOS
-        )
+    except Exception as e:
+        print(f"Could not process {svg_path} with {jpg_path}: {e}")
 
-        # 3. Open the rendered PNG
-        overlay_image = Image.open(temp_overlay).convert("RGBA")
+def process_pair(base_name, jpg_path, svg_path, meta_row, base_output_dir):
+    """
+    Names and renders the composite for one .jpg + .svg pair.
+    Top-level (and free of DB access) so it can run in a worker process.
+    
+    :param base_name: The shared base name of the pair, i.e. its BookmarkID.
+    :param jpg_path: The full path of the pair's .jpg file.
+    :param svg_path: The full path of the pair's .svg file.
+    :param meta_row: The (VolumeID, StartContainerPath, Title, adobe_location) tuple for the bookmark.
+    :param base_output_dir: The "composite markups" directory.
+    """
+    volume_id, start_container_path, bookmark_section_name, adobe_location = meta_row
 
-        # 4. Composite
-        composite_image = Image.alpha_composite(bg_image, overlay_image)
+    # The VolumeID => last part => book folder
+    book_title = get_book_title(volume_id)
 
-        # 5. Save
-        composite_image.save(output_path, format="PNG")
-        print(f"Saved composite image at: {output_path}")
+    # Some Chapter "names" are just a singular number, lets add the prefix "Chapter" to make it clear in the file name
+    if len(str(bookmark_section_name)) <= 1: bookmark_section_name = f"Chapter {bookmark_section_name}" 
+    
+    book_part_name = get_book_part_number(adobe_location)
+    markup_exact_location = get_ordering_number(start_container_path)
 
-    except Exception as e:
-        print(f"Could not process {svg_path} with {jpg_path}: {e}")
+    # Output file => "<basename>_composite.png" <basename> is truncated for legibility only.
+    output_name = f"markup_{bookmark_section_name}_{book_part_name}{markup_exact_location}_{base_name[:8]}.png"
 
-    finally:
-        # Remove temp file if it exists
-        if os.path.exists(temp_overlay):
-            os.remove(temp_overlay)
+    # Create a subfolder inside "composite markups" for the book
+    book_dir = os.path.join(base_output_dir, book_title)
+    os.makedirs(book_dir, exist_ok=True)
+
+    # Final path => "composite markups/<book_title>/<basename>_composite.png"
+    output_path = os.path.join(book_dir, output_name)
+
+    # Overlay the images
+    overlay_svg_on_jpg(jpg_path, svg_path, output_path)
+
+@dataclasses.dataclass
+class PairFiles:
+    """
+    The files found in the input directory for one base name.
+    
+    :param jpg: Full path of the base name's .jpg page, or None if there is none.
+    :param svg: Full path of the base name's .svg markup, or None if there is none.
+    """
+    jpg: "str | None" = None
+    svg: "str | None" = None
 
 def main():
     """
@@ -223,74 +361,53 @@ def main():
     base_output_dir = os.path.join(script_dir, "composite markups")
     os.makedirs(base_output_dir, exist_ok=True)
 
-    # Gather all files in script_dir
-    all_files = os.listdir(script_dir)
-
-    # We’ll map each base name -> list of metadata
-    # e.g. file_map["ABC-UUID"] = [".jpg", ".svg", "MyBookTitle"]
-    file_map = collections.defaultdict(list)
-
-    # 1) Build up the mapping
-    for filename in all_files:
-        full_path = os.path.join(script_dir, filename)
-        if os.path.isdir(full_path):
-            continue  # skip directories
-
-        base, ext = os.path.splitext(filename)
-        ext = ext.lower()
-
-        # We only care about .jpg and .svg for pairing
-        if ext in (".jpg", ".svg"):
-            file_map[base].append(ext)
-
-            # If it's an .svg, we look up the VolumeID => last part => book folder
-            if ext == ".svg":
-                unclean_vol_id = get_volume_id_for_bookmark(base)
-                # Handle case if unclean_vol_id is None
-                if unclean_vol_id is None:
-                    book_title = "UnknownBook"
+    # We’ll map each base name -> the PairFiles found for it
+    # e.g. file_map["ABC-UUID"] = PairFiles(jpg=".../ABC-UUID.jpg", svg=".../ABC-UUID.svg")
+    file_map = {}
+
+    # 1) Build up the mapping, streaming the directory. scandir's entries carry the file
+    #    type from the directory read itself, so the file check costs no extra stat().
+    with os.scandir(script_dir) as entries:
+        for entry in entries:
+            base, _, ext = entry.name.rpartition(".")
+            ext = ext.lower()
+
+            # We only care about .jpg and .svg files for pairing; test the name first,
+            # it is free, and most entries are already rejected by it
+            if base and (ext == "jpg" or ext == "svg") and entry.is_file():
+                pair_files = file_map.get(base)
+                if pair_files is None:
+                    pair_files = file_map[base] = PairFiles()
+                if ext == "jpg":
+                    pair_files.jpg = entry.path
                 else:
-                    vol_split = unclean_vol_id.split("/")
-                    book_title = vol_split[-1] if vol_split else "UnknownBook"
-                
-                file_map[base].append(book_title)
-
-    # 2) Process only those base names that have BOTH .jpg AND .svg
-    for base_name, exts in file_map.items():
-        if ".jpg" in exts and ".svg" in exts:
-            # exts should look like [".svg", "BookTitle"] or [".jpg", ".svg", "BookTitle"] etc.
-            # So let's extract the book folder name.
-            # We'll assume the last element is the book title if ext == ".svg" was found.
-            # Find the element that is not .jpg or .svg
-            possible_titles = [x for x in exts if x not in (".jpg", ".svg")]
-            if possible_titles:
-                book_title = possible_titles[-1]
-            else:
-                book_title = "UnknownBook"
-
-            # Build full paths
-            jpg_path = os.path.join(script_dir, base_name + ".jpg")
-            svg_path = os.path.join(script_dir, base_name + ".svg")
-
-            # Some Chapter "names" are just a singular number, lets add the prefix "Chapter" to make it clear in the file name
-            bookmark_section_name = get_section_title_for_bookmark(base_name)
-            if len(str(bookmark_section_name)) <= 1: bookmark_section_name = f"Chapter {bookmark_section_name}" 
-            
-            book_part_name = get_book_part_number_for_bookmark(base_name)
-            markup_exact_location = get_ordering_number_for_bookmark(base_name)
-
-            # Output file => "<basename>_composite.png" <basename> is truncated for legibility only.
-            output_name = f"markup_{bookmark_section_name}_{book_part_name}{markup_exact_location}_{base_name[:8]}.png"
-
-            # Create a subfolder inside "composite markups" for the book
-            book_dir = os.path.join(base_output_dir, book_title)
-            os.makedirs(book_dir, exist_ok=True)
-
-            # Final path => "composite markups/<book_title>/<basename>_composite.png"
-            output_path = os.path.join(book_dir, output_name)
-
-            # Overlay the images
-            overlay_svg_on_jpg(jpg_path, svg_path, output_path)
+                    pair_files.svg = entry.path
+
+    # 2) Keep only those base names that have BOTH .jpg AND .svg
+    pairs_to_process = [
+        base for base, pair_files in file_map.items()
+        if pair_files.jpg and pair_files.svg
+    ]
+
+    # Nothing to overlay: don't touch (or require) the Kobo database at all
+    if not pairs_to_process:
+        print("All matching .jpg + .svg pairs have been processed.")
+        return
+
+    # 3) Look up the metadata of every pair in one batched query
+    metadata = get_bookmark_metadata(pairs_to_process)
+
+    # 4) Overlay the pairs in parallel; each pair is independent and CPU-bound
+    meta_rows = [metadata.get(base_name, (None, None, None, None)) for base_name in pairs_to_process]
+    with concurrent.futures.ProcessPoolExecutor() as executor:
+        list(executor.map(
+            process_pair,
+            pairs_to_process,
+            [file_map[base_name].jpg for base_name in pairs_to_process],
+            [file_map[base_name].svg for base_name in pairs_to_process],
+            meta_rows,
+            itertools.repeat(base_output_dir)
+        ))
 
     print("All matching .jpg + .svg pairs have been processed.")
 